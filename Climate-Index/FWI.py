@@ -19,11 +19,16 @@ pop_path = ''
 years = [2025, 2030, 2050]
 # Define the population scenario for which to calculate the temperature index
 scenario = 'SSP2_CP' # SSP1_M, SSP2_CP, SSP3_H, SSP5_H	
+# Define the number of model files processed in parallel (each process holds a whole file in memory)
+max_workers = 1
 
 
-utils.index_all_models(index_type='fwi',
-                       model_path=model_path, 
-                       pop_path=pop_path, 
-                       years=years,
-                       scenario=scenario, 
-                       data_path=None) 
+# Model files are processed in parallel processes, so the call needs the main guard
+if __name__ == '__main__':
+    utils.index_all_models(index_type='fwi',
+                           model_path=model_path, 
+                           pop_path=pop_path, 
+                           years=years,
+                           scenario=scenario, 
+                           data_path=None,
+                           max_workers=max_workers)
@@ -26,10 +26,15 @@ pop_path = ''
 years = [2025, 2030, 2050]
 # Define the population scenario for which to calculate the temperature index
 scenario = 'SSP1_M' # SSP1_M, SSP2_CP, SSP3_H, SSP4, SSP5_H	
+# Define the number of model files processed in parallel (each process holds a whole file in memory)
+max_workers = 1
 
-utils.index_all_models(index_type='temperature_index',
-                       model_path=model_path,  
-                       pop_path=pop_path, 
-                       years=years,
-                       scenario=scenario,
-                       data_path=data_path) 
+# Model files are processed in parallel processes, so the call needs the main guard
+if __name__ == '__main__':
+    utils.index_all_models(index_type='temperature_index',
+                           model_path=model_path,  
+                           pop_path=pop_path, 
+                           years=years,
+                           scenario=scenario,
+                           data_path=data_path,
+                           max_workers=max_workers)
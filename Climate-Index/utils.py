@@ -1,9 +1,68 @@
 import numpy as np
 import pandas as pd
 import xarray as xr
-import re
+import dask.array as da
 import glob
 import os
+import multiprocessing
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+
+try:
+    from numba import njit, prange, get_num_threads, set_num_threads
+    HAS_NUMBA = True
+except ImportError:
+    # Numba is optional, without it the kernels are not used and NumPy is used instead
+    HAS_NUMBA = False
+    prange = range
+    def njit(*args, **kwargs):
+        return lambda function: function
+
+
+
+@njit(parallel=True, cache=True)
+def percentile_over_time(x, q, out):
+    
+    """
+    Calculate, per pixel, the q-th percentile over the last (time) axis, with the same 
+    linear interpolation as np.nanpercentile. Each time series is partitioned around the 
+    required rank instead of being sorted.
+    NaN values are skipped, as in np.nanpercentile and xr.quantile: the rank is computed 
+    from the number of valid values of the pixel, and pixels without valid values are NaN.
+
+    Parameters:
+    - x: np.ndarray, 3D array with dimensions (lat, lon, time).
+    - q: float, percentile to compute, between 0 and 100.
+    - out: np.ndarray, 2D array with dimensions (lat, lon) to store the result.
+
+    Returns:
+    - np.ndarray, out with the percentiles.
+    """
+    
+    for i in prange(x.shape[0]):
+        for j in range(x.shape[1]):
+            series = x[i, j]
+            values = series[~np.isnan(series)]
+            n = values.size
+            
+            if n == 0:
+                out[i, j] = np.nan
+                continue
+            
+            rank = q / 100 * (n - 1)
+            k = int(np.floor(rank))
+            k_upper = min(k + 1, n - 1)
+            fraction = rank - k
+            
+            # After partitioning, the values before k_upper are the smallest ones,
+            # so the k-th value is their maximum
+            buffer = np.partition(values, k_upper)
+            upper = buffer[k_upper]
+            lower = buffer[:k + 1].max()
+            out[i, j] = lower + fraction * (upper - lower)
+            
+    return out
 
 
 
@@ -32,35 +91,52 @@ def calculate_historical_percentiles(data_path: str, years: np.ndarray, step: in
     lats = range(0, 720, step)  
 
     p95_bands = [] #; p90_bands = []
-
-    # Iterate over each latitude band
-    for lat in lats:
-        
-        print(f"Processing latitudes: {lat} - {lat + step}")
-        
-        temporal_lat_data = []
+    
+    # Lazily open the datasets for all years at once; chunks are read and decoded
+    # in parallel by dask only when a latitude band is computed
+    data_names = [data_path + f'era5_t2m_max_day_{year}.nc' for year in years]
+    with xr.open_mfdataset(data_names, combine='by_coords', parallel=True,
+                           chunks={'latitude': step, 'longitude': 360, 'valid_time': 365}) as data:
         
-        for year in years:
+        # Allocate once the array holding a latitude band for all days, reused for every band
+        band_buffer = np.empty((step, data.sizes['longitude'], data.sizes['valid_time']), dtype=np.float32)
+
+        # Iterate over each latitude band
+        for lat in lats:
             
-            # Load the dataset for the specific year and latitude
-            data_name = f'era5_t2m_max_day_{year}.nc'
-            with xr.open_dataset(data_path + data_name) as data:
-                data = data['t2m'].isel(latitude=slice(lat, lat + step))
-                temporal_lat_data.append(data.load())
+            print(f"Processing latitudes: {lat} - {lat + step}")
             
-        # Concatenate the data for the current latitudes across all years
-        temporal_data = xr.concat(temporal_lat_data, dim='valid_time')
-        
-        # Calculate the 95th percentile for the latitude band and append it to the list
-        p95_band = temporal_data.quantile(0.95, dim='valid_time')
-        p95_bands.append(p95_band)
-        
-        # p90_band = temporal_data.quantile(0.90, dim='valid_time')
-        # p90_bands.append(p90_band)
+            # Select the current latitudes across all years, with time as the last axis
+            # so that each pixel's time series is contiguous in memory
+            temporal_data = (data['t2m'].isel(latitude=slice(lat, lat + step)).astype(np.float32)
+                             .transpose('latitude', 'longitude', 'valid_time'))
+            
+            # Read the latitude band (in parallel by dask) directly into the buffer, 
+            # without concatenating the yearly chunks in a new array
+            band = band_buffer[:temporal_data.sizes['latitude']]
+            da.store(temporal_data.data, band)
+            
+            # Calculate the 95th percentile for the latitude band and append it to the list
+            if HAS_NUMBA:
+                p95 = percentile_over_time(band, 95., np.empty(band.shape[:2], dtype=np.float32))
+            else:
+                # Skip NaN values, as percentile_over_time does
+                p95 = np.nanpercentile(band, 95, axis=-1).astype(np.float32)
+            p95_band = xr.DataArray(p95, coords={'latitude': temporal_data.latitude, 'longitude': temporal_data.longitude},
+                                    dims=('latitude', 'longitude'))
+            p95_bands.append(p95_band)
+            
+            # p90_band = temporal_data.quantile(0.90, dim='valid_time')
+            # p90_bands.append(p90_band)
         
-    p95_final = xr.concat(p95_bands, dim='latitude')
+    p95_final = xr.concat(p95_bands, dim='latitude').astype(np.float32)
     p95_final.name = 't2m_max_p95'
-    p95_final.to_netcdf(data_path + f'era5_t2m_max_{years[0]}-{years[-1]}_p95.nc')
+    
+    # Compress the file and store it in chunks of latitude bands, written through h5py
+    encoding = {'t2m_max_p95': {'zlib': True, 'complevel': 4, 'dtype': 'float32',
+                                'chunksizes': (min(step, p95_final.sizes['latitude']), p95_final.sizes['longitude'])}}
+    p95_final.transpose('latitude', 'longitude').to_netcdf(data_path + f'era5_t2m_max_{years[0]}-{years[-1]}_p95.nc',
+                                                           engine='h5netcdf', encoding=encoding)
     
     # p90_final = xr.concat(p90_bands, dim='latitude')
     # p90_final.name = 't2m_max_p90'
@@ -75,7 +151,8 @@ def align_data(data: xr.Dataset, celsius=False, longitude_shift=False, standar_n
     
     Parameters:
     - data: xr.Dataset, the dataset to align.
-    - celsius: bool, if True, converts temperature from Kelvin to Celsius.
+    - celsius: bool, if True, converts temperature from Kelvin to Celsius. The data is loaded
+      as a new float32 array and converted in place on it, so the input is never modified.
     - longitude_shif: bool, if True, shifts longitudes from 0-360 to -180-180.
     
     Returns:
@@ -83,67 +160,72 @@ def align_data(data: xr.Dataset, celsius=False, longitude_shift=False, standar_n
     """
     
     if celsius:
-        data = data - 273.15  # Convert from Kelvin to Celsius
+        # Load the data as a new float32 array and convert from Kelvin to Celsius in place
+        data = data.astype(np.float32).load()
+        variables = data.data_vars.values() if isinstance(data, xr.Dataset) else [data]
+        for variable in variables:
+            variable.values -= np.float32(273.15)
         
     if standar_names:
         data = homogenize_lat_lon(data)
         
     if longitude_shift:
-        data = data.assign_coords(longitude=((data.coords['longitude'] + 180) % 360 - 180)).sortby("longitude")
+        # Shift the longitudes and reorder the data once with the order that sorts them
+        longitude = (data.coords['longitude'] + 180) % 360 - 180
+        data = data.assign_coords(longitude=longitude).isel(longitude=np.argsort(longitude.values, kind='stable'))
 
     return data
 
 
 
+# Possible names of the latitude, longitude and time coordinates in the datasets
+COORD_ALIASES = {
+    'lat': 'latitude', 'Lat': 'latitude', 'LAT': 'latitude', 'nav_lat': 'latitude', 'lat_bnds': 'latitude',
+    'lon': 'longitude', 'Lon': 'longitude', 'LON': 'longitude', 'nav_lon': 'longitude', 'lon_bnds': 'longitude',
+    'time': 'time', 'Time': 'time', 'time_bnds': 'time',
+    }
+
+
+
 def homogenize_lat_lon(ds: xr.Dataset, new_lat='latitude', new_lon='longitude', new_time='valid_time'):
     
     """
     Renames latitude and longitude coordinates to standard ERA5 names.
+    The possible coordinate names are listed in COORD_ALIASES.
 
     Parameters:
     - ds: xarray.Dataset
-    - lat_names: list of possible latitude coordinate names
-    - lon_names: list of possible longitude coordinate names
     - new_lat: desired standard name for latitude
     - new_lon: desired standard name for longitude
+    - new_time: desired standard name for time
 
     Returns:
     - xarray.Dataset with standardized coordinate names
     """
     
-    lat_names = ['lat', 'Lat', 'LAT', 'nav_lat', 'lat_bnds']
-    lon_names = ['lon', 'Lon', 'LON', 'nav_lon', 'lon_bnds']
-    time_names = ['time', 'Time', 'time_bnds']
+    new_names = {'latitude': new_lat, 'longitude': new_lon, 'time': new_time}
 
-    rename_dict = {}
-    for name in ds.coords:
-        if name in lat_names:
-            rename_dict[name] = new_lat
-        elif name in lon_names:
-            rename_dict[name] = new_lon
-        elif name in time_names:
-            rename_dict[name] = new_time
+    rename_dict = {name: new_names[COORD_ALIASES[name]] for name in ds.coords if name in COORD_ALIASES}
 
     return ds.rename(rename_dict)
 
 
 
-def pop_and_regions(file_path: str, scenario: str, year: int, tas_max: xr.Dataset):
+@lru_cache(maxsize=32)
+def population_data(file_path: str, scenario: str, year: int, latitude: tuple, longitude: tuple):
     
-    '''Read scenario-dependent population data, interpolate it to yearly data, select specific year
-    reduce resolution if coarse is True.
-    Read netcdf file with region classification map.
+    '''Read scenario-dependent population data, select specific year and interpolate it 
+    to the model grid. Results are cached, so models sharing a grid reuse the interpolation.
     
     Parameters:
-    - wdir: str, working directory where the population data is stored.
+    - file_path: str, directory where the population data is stored.
     - scenario: str, the socioeconomic scenario for which to load population data.
-    - coarse: bool, if True, reduces the resolution of the population data.
-    - start_year: int, the starting year for the population data.
-    - end_year: int, the ending year for the population data.
+    - year: int, the year for which to select the population data.
+    - latitude: tuple, latitudes of the model grid.
+    - longitude: tuple, longitudes of the model grid.
     
     Returns:
-    - xr.Dataset, the population data interpolated to yearly resolution.
-    - xr.Dataset, the region classification map.
+    - xr.Dataset, the population data of the year on the model grid.
     '''
     
     # Load the population data from the specified file path
@@ -151,70 +233,143 @@ def pop_and_regions(file_path: str, scenario: str, year: int, tas_max: xr.Datase
     # Select yearly data for the specified scenario
     pop_year = pop.sel(time=f'{year}', method='nearest')
     # Interpolate lat and lon to match the model grid
-    pop_year = pop_year.interp(longitude=tas_max.longitude, latitude=tas_max.latitude)
+    pop_year = pop_year.interp(longitude=np.array(longitude), latitude=np.array(latitude))
+    
+    return pop_year
+
+
+
+@lru_cache(maxsize=32)
+def region_map(file_path: str, latitude: tuple, longitude: tuple):
+    
+    '''Read netcdf file with region classification map and interpolate it to the model grid.
+    The region map only depends on the grid, so results are cached and reused for all years 
+    and models with the same grid.
+    
+    Parameters:
+    - file_path: str, directory where the region classification map is stored.
+    - latitude: tuple, latitudes of the model grid.
+    - longitude: tuple, longitudes of the model grid.
+    
+    Returns:
+    - np.ndarray, integer IMAGE region of every valid pixel.
+    - np.ndarray, boolean mask of the flattened grid with the pixels that belong to a region.
+    '''
     
     # Load the region classification map
     greg = xr.open_dataset(file_path+'GREG.nc')
     # Interpolate the region map to match the model grid
-    greg = greg.interp(longitude=tas_max.longitude, latitude=tas_max.latitude, method='nearest')
+    greg = greg.interp(longitude=np.array(longitude), latitude=np.array(latitude), method='nearest')
     # Average over time and height dimensions (not needed for this analysis)
     greg = greg.mean(dim='time')
     
-    return pop_year, greg
+    # Flatten the map and keep only pixels where the region is not NaN
+    region_array = greg.GREG.values.ravel()
+    valid = ~np.isnan(region_array)
+    region_codes = region_array[valid].astype(np.int32)
+    
+    return region_codes, valid
 
 
 
-def get_region_values(index_xarray: xr.Dataset, pop_year: xr.Dataset, 
-                      region_mask: xr.Dataset, model_file: str, year: int,
-                      index_type: str):
+def get_region_values(index_xarray: xr.DataArray, pop_year: xr.Dataset, 
+                      region_codes: np.ndarray, valid: np.ndarray, model_file: str, year: int):
     
     """
-    Calculate the total number of days exceeding the 95th percentile and the population exposure 
-    for a specific region.
+    Calculate the population weighted average of the index for every IMAGE region (1-27).
 
     Parameters:
-    - exceedance_count: xr.Dataset, dataset containing the count of days exceeding the 95th percentile.
+    - index_xarray: xr.DataArray, index values on the model grid (e.g. count of days exceeding the 95th percentile).
     - pop_year: xr.Dataset, dataset containing the population data for the specified year.
-    - region_mask: xr.Dataset, dataset containing the mask for the specific region.
+    - region_codes: np.ndarray, integer IMAGE region of every valid pixel, as returned by region_map.
+    - valid: np.ndarray, boolean mask of the pixels that belong to a region, as returned by region_map.
+    - model_file: str, name of the model file, used to get the model and scenario names.
+    - year: int, the year of the index values, used in the column name.
 
     Returns:
-    - tuple of (total_exceedance_days, total_population_exposure)
+    - tuple of (column_name, values), where values is an array with the population weighted
+      index of the IMAGE regions 1-27.
     """
     
-    # Extract the model name from the file name using regex
-    if index_type == 'temperature_index':
-        model_name = re.search(r'day_(.*)_r', model_file).group(1) 
-    elif index_type == 'fwi':
-        model_name = re.search(r'fwixd_ann_(.*)_r', model_file).group(1)
+    # Extract the model and scenario names from the file name, which follows the format
+    # '<variable>_<frequency>_<model>_<scenario>_<variant>_...'
+    parts = model_file[:-3].split('_')
+    model_name = f'{parts[2]}_{parts[3]}'
+    
+    # Keep only the pixels that belong to a region, as float64 to accumulate the sums.
+    # Masking already makes a copy, so missing values are set to zero in place
+    pop = np.nan_to_num(pop_year.GPOP.values.ravel()[valid].astype(np.float64, copy=False), copy=False)
+    weights = np.nan_to_num(index_xarray.values.ravel()[valid].astype(np.float64, copy=False), copy=False)
+    weights *= pop
     
-    # Flatten the datasets to create a DataFrame for easier manipulation
-    region_array = region_mask.GREG.values.flatten()
-    pop_array = pop_year.GPOP.values.flatten()
-    index_array = index_xarray.values.flatten()
+    # Population weighted average of the index per region (regions are numbered 1-27)
+    num = np.bincount(region_codes, weights=weights, minlength=28)[1:28]
+    den = np.bincount(region_codes, weights=pop, minlength=28)[1:28]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values = num / den
     
-    # Create a DataFrame with the flattened data
-    regions_df = pd.DataFrame({
-        'IMAGE_region': region_array,
-        'T95': index_array,
-        'population': pop_array
-    })
+    # Region 27 is not included in the analysis
+    values[26] = np.nan
 
-    # Remove rows where the region is NaN
-    regions_df = regions_df[(~regions_df['IMAGE_region'].isna()) & (regions_df['IMAGE_region']!=27.)]
+    return f'{year}_{model_name}', values
+
+
+
+@njit(parallel=True, cache=True)
+def count_exceedance(tas, thresh, out):
     
-    # Group by region and calculate the weighted average of the 95th percentile exceedance
-    regions_df = (
-        regions_df
-        .groupby('IMAGE_region')
-        .apply(lambda x: (x['T95'] * x['population']).sum() / x['population'].sum())
-        .reset_index(name=f'{year}_{model_name}')
-        )
+    """
+    Count, per pixel, the number of time steps where tas exceeds thresh.
+    The comparison and the sum are done in a single pass, without creating
+    a boolean array of the size of tas.
+
+    Parameters:
+    - tas: np.ndarray, 3D array with dimensions (time, lat, lon).
+    - thresh: np.ndarray, 2D array with dimensions (lat, lon).
+    - out: np.ndarray, 2D array with dimensions (lat, lon) initialized to zero.
+
+    Returns:
+    - np.ndarray, out with the counts.
+    """
+    
+    for i in prange(tas.shape[1]):
+        for t in range(tas.shape[0]):
+            for j in range(tas.shape[2]):
+                if tas[t, i, j] > thresh[i, j]:
+                    out[i, j] += 1
+                    
+    return out
+
 
-    return regions_df
+
+def exceedance_days(tas_max: xr.DataArray, threshold: np.ndarray):
+    
+    """
+    Calculate the number of days where the daily maximum temperature exceeds the threshold.
+
+    Parameters:
+    - tas_max: xr.DataArray, daily maximum temperature with dimensions (valid_time, latitude, longitude).
+    - threshold: np.ndarray, 2D float32 array with the threshold on the (latitude, longitude) 
+      grid of tas_max.
+
+    Returns:
+    - xr.DataArray, number of days exceeding the threshold per pixel.
+    """
+    
+    # The kernel requires contiguous arrays with the same dtype
+    tas = np.ascontiguousarray(tas_max.transpose('valid_time', 'latitude', 'longitude').values, dtype=np.float32)
+    
+    if HAS_NUMBA:
+        count = count_exceedance(tas, threshold, np.zeros(threshold.shape, dtype=np.uint16))
+    else:
+        count = np.count_nonzero(tas > threshold, axis=0).astype(np.uint16)
+    
+    return xr.DataArray(count, coords={'latitude': tas_max.latitude, 'longitude': tas_max.longitude},
+                        dims=('latitude', 'longitude'))
 
 
 
-def temperature_index(years, model_path, data_path, pop_file, final_data, model_file_name, scenario, index_type='temperature_index'):
+def temperature_index(years, model_path, data_path, pop_file, model_file_name, scenario):
     
     '''
     Calculate the number of days exceeding the 95th percentile of daily maximum temperature
@@ -230,8 +385,8 @@ def temperature_index(years, model_path, data_path, pop_file, final_data, model_
     - p95_hist: xr.Dataset, dataset containing the historical 95th percentile data.
     
     Returns:
-    - final_regions: pd.DataFrame, DataFrame containing the total number of days exceeding the 95th percentile
-    and the population exposure for each region.
+    - final_regions: list of (column_name, values) tuples, one per year, with the population weighted
+    number of days exceeding the 95th percentile for each region.
     '''
     
     print(f'Processing model file: {model_file_name}')
@@ -245,42 +400,44 @@ def temperature_index(years, model_path, data_path, pop_file, final_data, model_
     # Align the data to ensure consistency in units and coordinates
     tas_max = align_data(tas_max['tasmax'], celsius=True, longitude_shift=True, standar_names=True)
     
-    # Extract the start and end years from the model file name using regex
-    match = re.search(r'_(\d{8})-(\d{8})', model_file_name)
-    start_year = int(match.group(1)[:4])
-    end_year = int(match.group(2)[:4])
+    # Interpolate the p95 historical data to match the tas_max grid. The grid is the same
+    # for all years of the model file, so only the numeric threshold grid is kept
+    p95_hist = p95_hist.t2m_max_p95.interp(longitude=tas_max.longitude, latitude=tas_max.latitude)
+    p95_hist = np.ascontiguousarray(p95_hist.transpose('latitude', 'longitude').values, dtype=np.float32)
+    
+    # Positions of the time steps of each year, computed once for all years
+    year_indices = tas_max.groupby('valid_time.year').groups
+    
+    # Model grid, used as key to reuse the interpolated population and region data
+    grid = (tuple(tas_max.latitude.values), tuple(tas_max.longitude.values))
     
-    # Create a range of years from the start to end year
-    year_range = np.arange(start_year, end_year + 1)
+    # Interpolate the region map to the model grid
+    region_codes, valid = region_map(pop_file, *grid)
+    
+    final_regions = []
     
     # Iterate over the specified years and calculate the index
     for year in years:
-        # Check if the year is within the range of years in the model file
-        if year in year_range:
+        # Check if the year is in the model data
+        if year in year_indices:
     
             # Select the tasmax variable and filter by year
-            tas_max_year = tas_max.sel(valid_time=slice(f'{year}-01-01', f'{year}-12-31'))
-            
-            # Interpolate the p95 historical data to match the tas_max grid        
-            p95_hist = p95_hist.interp(longitude=tas_max.longitude, latitude=tas_max.latitude)
+            tas_max_year = tas_max.isel(valid_time=year_indices[year])
             
             # Calculate the number of days that exceed the 95th percentile
-            excedance_count = (tas_max_year > p95_hist).sum(dim='valid_time')
+            excedance_count = exceedance_days(tas_max_year, p95_hist)
             
             # Calculate the population exposure
-            population, image_regions = pop_and_regions(pop_file, f'{scenario}', year, tas_max_year)
+            population = population_data(pop_file, f'{scenario}', year, *grid)
             
             # Get the total number of days exceeding the 95th percentile and the population exposure for each region
-            final_regions = get_region_values(excedance_count.t2m_max_p95, population, image_regions, model_file_name, year, index_type)
-
-            # Merge the results into the final DataFrame
-            final_data = final_data.merge(final_regions, on='IMAGE_region', how='outer')
+            final_regions.append(get_region_values(excedance_count, population, region_codes, valid, model_file_name, year))
             
-    return final_data
+    return final_regions
 
 
 
-def fire_weather_index(years, model_path, pop_path, final_data, model_file_name, scenario, index_type='fwi'):
+def fire_weather_index(years, model_path, pop_path, model_file_name, scenario):
     
     '''
     Calculate the fire weather index for a given scenario and year using a specific model's data.
@@ -294,7 +451,8 @@ def fire_weather_index(years, model_path, pop_path, final_data, model_file_name,
     - pop_path: str, path to the directory containing the population data files.
     
     Returns:
-    - final_data: pd.DataFrame, DataFrame containing the fire weather index for each region.
+    - final_regions: list of (column_name, values) tuples, one per year, with the fire weather index 
+    for each region.
     '''
     
     print(f'Processing model file: {model_file_name}')
@@ -305,6 +463,14 @@ def fire_weather_index(years, model_path, pop_path, final_data, model_file_name,
     # Align the data to ensure consistency in units and coordinates
     fwi = align_data(fwi, celsius=False, longitude_shift=True, standar_names=True)
     
+    # Model grid, used as key to reuse the interpolated population and region data
+    grid = (tuple(fwi.latitude.values), tuple(fwi.longitude.values))
+    
+    # Interpolate the region map to the fwi grid
+    region_codes, valid = region_map(pop_path, *grid)
+    
+    final_regions = []
+    
     # Iterate over the specified years and calculate the index
     for year in years:
         
@@ -312,65 +478,95 @@ def fire_weather_index(years, model_path, pop_path, final_data, model_file_name,
         fwi_year = fwi.sel(valid_time=slice(f'{year}-01-01', f'{year}-12-31'))
         
         # Interpolate population data to match fwi grid
-        population, image_regions = pop_and_regions(pop_path, f'{scenario}', year, fwi_year)
+        population = population_data(pop_path, f'{scenario}', year, *grid)
         
         # Calculate total FWI exposure per region
-        final_regions = get_region_values(fwi_year.fwixd, population, image_regions, model_file_name, year, index_type)
-
-        # Merge the results into the final DataFrame
-        final_data = final_data.merge(final_regions, on='IMAGE_region', how='outer')
+        final_regions.append(get_region_values(fwi_year.fwixd, population, region_codes, valid, model_file_name, year))
         
-    return final_data
+    return final_regions
 
 
 
-def index_all_models(index_type, model_path, pop_path, years, scenario, data_path=None):
+def limit_worker_threads(num_threads):
+    
+    '''
+    Initialize a worker process of index_all_models. Every worker runs the Numba kernels
+    with num_threads threads, so that the processes do not oversubscribe the CPUs.
+    '''
+    
+    if HAS_NUMBA:
+        set_num_threads(num_threads)
+
+
+
+def index_all_models(index_type, model_path, pop_path, years, scenario, data_path=None, max_workers=1):
     
     '''
     Calculate index for all models in the specified model path.
+    Model files are independent from each other and are processed in parallel, 
+    with up to max_workers processes. Every process holds a whole model file in memory,
+    so increase max_workers only if enough memory is available.
     '''
     
-    # Initialize an empty DataFrame to hold the temperature index data for each model
-    models_data = pd.DataFrame(index=pd.Index(np.arange(1,28,1.), name='IMAGE_region'))
+    # Initialize a dictionary to hold the index values of each model and year
+    models_columns = {}
     
     if index_type == 'fwi':
         
         # Get all the netCDF files for tasmax in the specified model path
         files = glob.glob(os.path.join(model_path, 'fwixd_ann_*.nc'))
         
-        # Loop through each file and extract the fire weather index data for the specified years
-        for file in files:
-            models_data = fire_weather_index(years, model_path, pop_path, models_data, os.path.basename(file), scenario, index_type)
+        # Extract the fire weather index data for the specified years from each file
+        index_function = partial(fire_weather_index, years, model_path, pop_path, scenario=scenario)
         
     if index_type == 'temperature_index':
 
         # Get all the netCDF files for tasmax in the specified model path
         files = glob.glob(os.path.join(model_path, 'tasmax_day_*.nc'))
 
-        # Loop through each file and extract the temperature index data for the specified years
-        for file in files:
-            models_data = temperature_index(years, model_path, data_path, pop_path, models_data, os.path.basename(file), scenario, index_type)        
-
-    # Extract the year, model, and scenario from the column names
-    column_info = models_data.columns.str.extract(r'(?P<year>\d{4})_(?P<model>.+?)_(?P<scenario>.+)')
-
-    # Create a DataFrame to hold the mean and standard deviation of each model
-    df_mean = pd.DataFrame(index=models_data.index)
-    df_std = pd.DataFrame(index=models_data.index)
-
-    # Create a new column for the model names in the DataFrame
-    group_keys = column_info['year'].astype(str) + '_' + column_info['scenario'].astype(str)
-
-    # Calculate the mean and standard deviation for each group of models
-    for group in group_keys.unique():
-        cols_in_group = models_data.columns[group_keys == group]
-        df_mean[group + '_model-mean'] = models_data[cols_in_group].mean(axis=1)
-        df_std[group + '_model-std'] = models_data[cols_in_group].std(axis=1)
+        # Extract the temperature index data for the specified years from each file
+        index_function = partial(temperature_index, years, model_path, data_path, pop_path, scenario=scenario)
+
+    max_workers = max(1, min(max_workers, len(files)))
+    file_names = [os.path.basename(file) for file in files]
+
+    if max_workers == 1:
+        # Process the files one by one in this process, with all the Numba threads
+        all_regions = list(map(index_function, file_names))
+    else:
+        # Process the files in parallel, keeping the results in the order of the files.
+        # Workers are spawned instead of forked, since forking a process that already runs
+        # Numba or dask threads can hang. The Numba threads are shared among the workers
+        num_threads = max(1, get_num_threads() // max_workers) if HAS_NUMBA else 1
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=limit_worker_threads, initargs=(num_threads,)) as executor:
+            all_regions = list(executor.map(index_function, file_names))
+
+    for file_name, final_regions in zip(file_names, all_regions):
+        for column, values in final_regions:
+            # Columns are named after the year, model and scenario only, so files of other
+            # variants of the same model would overwrite each other
+            if column in models_columns:
+                warnings.warn(f'Column {column} from {file_name} is already computed from another file, skipping it')
+                continue
+            models_columns[column] = values
+
+    # Build the DataFrame with the data of all models at once
+    models_data = pd.DataFrame(models_columns, index=pd.Index(np.arange(1,28), name='IMAGE_region'))
+
+    # Extract the year, model, and scenario from the column names ('<year>_<model>_<scenario>')
+    column_info = [column.split('_', 2) for column in models_data.columns]
+
+    # Group the models by year and scenario
+    group_keys = pd.Index([f'{year}_{climate_scenario}' for year, model, climate_scenario in column_info])
+
+    # Calculate the mean and standard deviation for all groups of models at once
+    group_stats = models_data.T.groupby(group_keys, sort=False).agg(['mean', 'std'])
+    df_mean = group_stats.xs('mean', axis=1, level=1).T.add_suffix('_model-mean')
+    df_std = group_stats.xs('std', axis=1, level=1).T.add_suffix('_model-std')
 
     # Combine the mean and standard deviation DataFrames
     df_summary = pd.concat([df_mean, df_std], axis=1)
-    df_summary = df_summary.set_index('nan_nan_model-mean')
-    df_summary.index = df_summary.index.astype(int)
 
     # Load the IMAGE regions names
     image_names = pd.read_csv(pop_path + 'IMAGE_regions.csv', index_col=0)
@@ -380,5 +576,5 @@ def index_all_models(index_type, model_path, pop_path, years, scenario, data_pat
     
     # Save the results to CSV files
     index_models.to_csv(model_path + f'{index_type}_{scenario[:4]}-pop.csv', index=False)
-    models_data.to_csv(model_path + f'{index_type}_all_models_{scenario[:4]}-pop.csv', index=False)
+    models_data.to_csv(model_path + f'{index_type}_all_models_{scenario[:4]}-pop.csv')
     